@@ -4,10 +4,16 @@
 # Input the correctly formatted csv/xlsx and a plot is exported.
 # The purpose of this code is to plot the processed data from the confocal measurements formatted in three columns.
 # The csv or xlsx file should be formatted with columns X-axis, Y-axis, SD.
-# Check if the x-axis is required to be on a logarithmic scale (line 57)
+# Check if the x-axis is required to be on a logarithmic scale (line 78)
 # The plot is exported as an SVG file.
 
+import os
 import pandas as pd
+import matplotlib
+
+show_plot = True  # Set to False for batch/headless runs, the plot is then only saved using the non-interactive Agg backend
+if not show_plot:
+    matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 
@@ -17,9 +23,26 @@ plt.rcParams['mathtext.fontset'] = 'custom'  # Use custom math font settings
 plt.rcParams['mathtext.rm'] = 'Arial'  # Regular (rm) font to Arial
 plt.rcParams['mathtext.it'] = 'Arial:italic'  # Italic font to Arial (if needed)
 plt.rcParams['mathtext.bf'] = 'Arial:bold'  # Bold font to Arial
+plt.rcParams['svg.fonttype'] = 'none'  # Keep text as text in the SVG instead of a path for every glyph
+
+# Step 1: Read the csv or Excel file (a .csv loads fastest, so convert large .xlsx files first)
+def read_table(path):
+    """
+    Read the Conc, Mean and SD columns from a .csv or .xlsx file.
+    csv files use the pyarrow engine and xlsx files the calamine engine, falling back to the pandas defaults if they are not installed.
+    """
+    dtypes = {'Conc': 'float64', 'Mean': 'float64', 'SD': 'float64'}
+    if os.path.splitext(path)[1].lower() == '.csv':
+        try:
+            return pd.read_csv(path, engine='pyarrow', dtype=dtypes)
+        except (ImportError, ValueError):  # pyarrow not installed, or a pandas older than 1.4 without the engine
+            return pd.read_csv(path, dtype=dtypes)
+    try:
+        return pd.read_excel(path, engine='calamine', dtype=dtypes)
+    except (ImportError, ValueError):  # python-calamine not installed, or a pandas older than 2.2 without the engine
+        return pd.read_excel(path, dtype=dtypes)
 
-# Step 1: Read the Excel file
-df = pd.read_excel(r"FILELOCATION\FILENAME.xlsx")
+df = read_table(r"FILELOCATION\FILENAME.xlsx")
 
 # Step 2: Extract the relevant columns (ensure your Excel file has these columns)
 x = df['Conc'] #corresponding csv column title for x-axis
@@ -31,11 +54,9 @@ y_sd = df['SD']
 # Step 4: Plot the scatter plot with error bars
 plt.figure(figsize=(14, 12))
 
-# Error bars with custom thickness and color
-plt.errorbar(x, y, yerr=y_sd, fmt='o', capsize=5, ecolor='black', elinewidth=2)
-
-# Make dots larger and black
-plt.scatter(x, y, s=150, c='black', zorder=5)  # s=100 makes dots larger, c='black' makes them black
+# Error bars with custom thickness and color, drawn with large black dots in the same call
+plt.errorbar(x, y, yerr=y_sd, fmt='o', markersize=12.25, markerfacecolor='black', markeredgecolor='black',
+             capsize=5, ecolor='black', elinewidth=2, zorder=5)  # markersize 12.25 gives the same dot area as scatter s=150
 
 # Step 5: Customize tick marks (thickness of 2 and length of 10 for both major and minor ticks)
 plt.tick_params(axis='x', width=2, length=10, labelsize=30, which='both')  # X-axis ticks (major + minor)
@@ -65,4 +86,5 @@ plt.tight_layout()  # Ensures the plot is fully contained within the figure
 plt.savefig("SAVEFILMENAME.svg", format='svg')  # Saves the plot as an SVG
 
 # Show the plot
-plt.show()
+if show_plot:
+    plt.show()
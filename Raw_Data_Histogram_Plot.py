@@ -7,8 +7,12 @@
 # The plot is exported as an SVG file.
 
 import numpy as np
+import matplotlib
+
+show_plot = True  # Set to False for batch/headless runs, the plot is then only saved using the non-interactive Agg backend
+if not show_plot:
+    matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import csv
 import os
 import matplotlib.ticker as ticker  # Import the ticker module
 
@@ -18,38 +22,86 @@ plt.rcParams['mathtext.fontset'] = 'custom'  # Use custom math font settings
 plt.rcParams['mathtext.rm'] = 'Arial'  # Regular (rm) font to Arial
 plt.rcParams['mathtext.it'] = 'Arial:italic'  # Italic font to Arial (if needed)
 plt.rcParams['mathtext.bf'] = 'Arial:bold'  # Bold font to Arial
+plt.rcParams['svg.fonttype'] = 'none'  # Keep text as text in the SVG instead of a path for every glyph
 
 # Path and filenames
 path_A = r"FILELOCATION"
 file_stem_A = "FILENAME"  # Filename before the underscore
 number_of_files = 10  # Number of files in the folder
+use_pandas = False  # True reads the files with the pandas C parser (typically 2-3x faster than np.loadtxt, requires pandas)
+chunk_size = 1_000_000  # Rows parsed per block by the pandas reader, keeps the parser buffers small for long acquisitions
+use_cache = True  # Saves each parsed file as a binary .npy next to the data and reloads it on later runs
+
+def load_cache(cache_file, filename):
+    """
+    Memory-map cache_file if it is newer than filename, return None if there is no usable cache.
+    """
+    if not (os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(filename)):
+        return None
+    try:
+        return np.load(cache_file, mmap_mode='r')
+    except (OSError, ValueError):
+        print(f"Ignoring unreadable cache file: {cache_file}")
+        return None
+
+def save_cache(cache_file, arr):
+    """
+    Write arr to cache_file through a temporary file so an interrupted write never leaves a truncated cache behind.
+    """
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        print(f"Could not write cache file: {cache_file}")
+    finally:
+        if os.path.exists(tmp_file):
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+
+def read_channel_A(filename):
+    """
+    Parse the first (channel A) column of a tab separated data file into a float32 array.
+    The parsed array is cached as filename.col0.npy (shared with the threshold export) and memory-mapped on later runs while the cache is newer than the file.
+    """
+    cache_file = f"{filename}.col0.npy"
+    if use_cache:
+        cached = load_cache(cache_file, filename)
+        if cached is not None:
+            return cached
+
+    if use_pandas:
+        import pandas as pd
+        with pd.read_csv(filename, sep='\t', header=None, usecols=[0], dtype=np.float32, engine='c',
+                         chunksize=chunk_size) as reader:
+            arr = np.concatenate([chunk.to_numpy(dtype=np.float32)[:, 0] for chunk in reader])
+    else:
+        arr = np.loadtxt(filename, dtype=np.float32, delimiter='\t', usecols=(0,), ndmin=1)
+
+    if use_cache:
+        save_cache(cache_file, arr)
+    return arr
 
 def load_files_A(number_of_files):
-    channelA_A = []  # Where channel A data will be stored
-    
-    for i in range(number_of_files):
-        if i == 0:
-            filename = os.path.join(path_A, file_stem_A)
-        else:
-            filename = os.path.join(path_A, f"{file_stem_A}_{i + 1:02d}")
-        
-        a = 0  # Row counter
-        with open(filename) as csvDataFile:  # Opens the file as a CSV
-            csvReader = csv.reader(csvDataFile, delimiter='\t')  # Assigns the loaded CSV file to csvReader.
-            for row in csvReader:
-                channelA_A.append(float(row[0]))  # Convert to float for numerical operations
-                a += 1
-        
-        print(f"Loaded {filename}, which contains {a} rows.")
-    
-    channelA_arr_A = np.asarray(channelA_A, dtype=np.float32)  # Converts to numpy arrays for vector calculations.
+    # The file list is built once, the first file has no numbered suffix
+    filenames = [os.path.join(path_A, file_stem_A if i == 0 else f"{file_stem_A}_{i + 1:02d}") for i in range(number_of_files)]
+    chunks = []  # Where channel A data will be stored, one array per file
+
+    for filename in filenames:
+        chunks.append(read_channel_A(filename))  # Parsed in C rather than row by row
+        print(f"Loaded {filename}, which contains {len(chunks[-1])} rows.")
+
+    channelA_arr_A = np.concatenate(chunks)  # Joins the files into one array for vector calculations.
     return channelA_arr_A
 
 # Load data for Channel A
 channelA_arr_A = load_files_A(number_of_files)
 
 def plot_histogram(data, bins=50, xlim=None, ylim=None, xlabel="Channel A Value", ylabel="Frequency", title=None, 
-                   xtick_distance=None, bin_color='blue', bottom_threshold=None, top_threshold=None, box_thickness=2):
+                   xtick_distance=None, bin_color='blue', bottom_threshold=None, top_threshold=None, box_thickness=2, ax=None):
     """
     Plot a histogram with customizable bins, axis limits, x-tick spacing, and threshold filter.
 
@@ -66,12 +118,16 @@ def plot_histogram(data, bins=50, xlim=None, ylim=None, xlabel="Channel A Value"
     - bottom_threshold: Minimum value of data to be included (if None, no filtering is applied)
     - top_threshold: Maximum value of data to be included (if None, no filtering is applied)
     - box_thickness: Thickness of the box (spines) around the plot
+    - ax: Axes to draw on, cleared first so one figure can be reused between plots (if None, a new figure is created)
     """
     # Apply the bottom and top threshold filters (if provided)
-    if bottom_threshold is not None:
-        data = data[data >= bottom_threshold]
-    if top_threshold is not None:
-        data = data[data <= top_threshold]
+    # The data is sorted once so the filters become a single slice instead of boolean masks and copies
+    data_sorted = bottom_threshold is not None or top_threshold is not None
+    if data_sorted:
+        data = np.sort(data)
+        lo = np.searchsorted(data, bottom_threshold, side='left') if bottom_threshold is not None else 0
+        hi = np.searchsorted(data, top_threshold, side='right') if top_threshold is not None else len(data)
+        data = data[lo:hi]
 
     # Adjust bins based on xlim if it's provided
     if xlim:
@@ -80,17 +136,38 @@ def plot_histogram(data, bins=50, xlim=None, ylim=None, xlabel="Channel A Value"
         bins = np.linspace(xmin, xmax, bins)
 
     # Plot histogram
-    plt.figure(figsize=(8, 8))  # Changed plot size to (8, 8)
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(8, 8))  # Changed plot size to (8, 8)
+    else:
+        ax.cla()  # Reuse the existing figure rather than creating a new one
+    plt.sca(ax)
     
     # If a single color is provided for all bins, use that color
     if isinstance(bin_color, str):
-        n, bins_edges, patches = plt.hist(data, bins=bins, edgecolor='black', alpha=0.7, color=bin_color)
+        color = bin_color
     # If bin_color is a list of colors (same length as number of bins), use them
     elif isinstance(bin_color, list) and len(bin_color) == len(bins):
-        n, bins_edges, patches = plt.hist(data, bins=bins, edgecolor='black', alpha=0.7, color=bin_color)
+        color = bin_color
     else:
         # If bin_color is not valid, default to blue
-        n, bins_edges, patches = plt.hist(data, bins=bins, edgecolor='black', alpha=0.7, color='blue')
+        color = 'blue'
+
+    if xlim:
+        # The bins are uniform, so count them with np.bincount on the rescaled data instead of np.histogram
+        nbins = len(bins) - 1
+        # Values outside the bins are dropped, xmax falls in the last bin
+        if data_sorted:
+            inside = data[np.searchsorted(data, xmin, side='left'):np.searchsorted(data, xmax, side='right')]
+        else:
+            inside = data[(data >= xmin) & (data <= xmax)]
+        idx = np.minimum(((inside - xmin) * (nbins / (xmax - xmin))).astype(np.intp), nbins - 1)
+        # Correct rounding at the bin edges so the counts match np.histogram exactly
+        idx[inside < bins[idx]] -= 1
+        idx[(inside >= bins[idx + 1]) & (idx != nbins - 1)] += 1
+        n = np.bincount(idx, minlength=nbins)
+        plt.bar(bins[:-1], n, width=np.diff(bins), align='edge', edgecolor='black', alpha=0.7, color=color)
+    else:
+        n, bins_edges, patches = plt.hist(data, bins=bins, edgecolor='black', alpha=0.7, color=color)
 
     # Customization for the x and y limits
     if xlim:
@@ -137,11 +214,15 @@ def plot_histogram(data, bins=50, xlim=None, ylim=None, xlabel="Channel A Value"
     plt.savefig(output_file, format='svg')  # Save as SVG
     
     # Show the plot
-    plt.show()
+    if show_plot:
+        plt.show()
+
+# One figure is created and passed to every plot_histogram call
+fig, ax = plt.subplots(figsize=(8, 8))
 
 # Example of plotting the histogram with custom parameters
 # Setting a bottom threshold value to filter out data below it (e.g., bottom_threshold = 30) 
 # and a top threshold to filter out values above a certain threshold (e.g., top_threshold = 200)
 plot_histogram(channelA_arr_A, bins=50, xlim=(50, 250), ylim=(0, 750), 
                xtick_distance=50, bin_color='grey', bottom_threshold=50, top_threshold=200, 
-               box_thickness=2)
+               box_thickness=2, ax=ax)
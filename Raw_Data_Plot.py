@@ -5,12 +5,16 @@
 # The purpose of this code is to process and plot the raw data exported from the confocal measurements.
 # Each run is composed of 10 data files but the number of files plotted can be selected using number_of_files.
 # The x-axis is plotted as time and hence is dependent on the acquisition rate.
-# In this case the data was acquired at 10,000 Hz hence the x values should by divded by 10,000. See time_values line 55.
+# In this case the data was acquired at 10,000 Hz hence the x values should by divded by 10,000. See time_values line 106.
 # The plot is exported as an SVG file.
 
 import numpy as np
+import matplotlib
+
+show_plot = True  # Set to False for batch/headless runs, the plot is then only saved using the non-interactive Agg backend
+if not show_plot:
+    matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import csv
 import os
 import matplotlib.ticker as ticker  # Import the ticker module
 
@@ -20,45 +24,119 @@ plt.rcParams['mathtext.fontset'] = 'custom'  # Use custom math font settings
 plt.rcParams['mathtext.rm'] = 'Arial'  # Regular (rm) font to Arial
 plt.rcParams['mathtext.it'] = 'Arial:italic'  # Italic font to Arial (if needed)
 plt.rcParams['mathtext.bf'] = 'Arial:bold'  # Bold font to Arial
+plt.rcParams['svg.fonttype'] = 'none'  # Keep text as text in the SVG instead of a path for every glyph
 
 # Path and filenames
 path_A = r"FILESTEMLOCATION"
 file_stem_A = "FILENAME" # Filename before the underscore
 number_of_files = 2  # Number of files in the folder
+use_pandas = False  # True reads the files with the pandas C parser (typically 2-3x faster than np.loadtxt, requires pandas)
+chunk_size = 1_000_000  # Rows parsed per block by the pandas reader, keeps the parser buffers small for long acquisitions
+use_cache = True  # Saves each parsed file as a binary .npy next to the data and reloads it on later runs
+
+def load_cache(cache_file, filename):
+    """
+    Memory-map cache_file if it is newer than filename, return None if there is no usable cache.
+    """
+    if not (os.path.exists(cache_file) and os.path.getmtime(cache_file) >= os.path.getmtime(filename)):
+        return None
+    try:
+        return np.load(cache_file, mmap_mode='r')
+    except (OSError, ValueError):
+        print(f"Ignoring unreadable cache file: {cache_file}")
+        return None
+
+def save_cache(cache_file, arr):
+    """
+    Write arr to cache_file through a temporary file so an interrupted write never leaves a truncated cache behind.
+    """
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        print(f"Could not write cache file: {cache_file}")
+    finally:
+        if os.path.exists(tmp_file):
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+
+def read_channel_A(filename):
+    """
+    Parse the first (channel A) column of a tab separated data file into a float32 array.
+    The parsed array is cached as filename.col0.npy (shared with the threshold export) and memory-mapped on later runs while the cache is newer than the file.
+    """
+    cache_file = f"{filename}.col0.npy"
+    if use_cache:
+        cached = load_cache(cache_file, filename)
+        if cached is not None:
+            return cached
+
+    if use_pandas:
+        import pandas as pd
+        with pd.read_csv(filename, sep='\t', header=None, usecols=[0], dtype=np.float32, engine='c',
+                         chunksize=chunk_size) as reader:
+            arr = np.concatenate([chunk.to_numpy(dtype=np.float32)[:, 0] for chunk in reader])
+    else:
+        arr = np.loadtxt(filename, dtype=np.float32, delimiter='\t', usecols=(0,), ndmin=1)
+
+    if use_cache:
+        save_cache(cache_file, arr)
+    return arr
 
 def load_files_A(number_of_files):
-    channelA_A = []  # Where channel A data will be stored
-    
-    for i in range(number_of_files):
-        if i == 0:
-            filename = os.path.join(path_A, file_stem_A)
-        else:
-            filename = os.path.join(path_A, f"{file_stem_A}_{i + 1:02d}")
-        
-        a = 0  # Row counter
-        with open(filename) as csvDataFile:  # Opens the file as a CSV
-            csvReader = csv.reader(csvDataFile, delimiter='\t')  # Assigns the loaded CSV file to csvReader.
-            for row in csvReader:
-                channelA_A.append(float(row[0]))  # Convert to float for numerical operations
-                a += 1
-        
-        print(f"Loaded {filename}, which contains {a} rows.")
-    
-    channelA_arr_A = np.asarray(channelA_A, dtype=np.float32)  # Converts to numpy arrays for vector calculations.
+    # The file list is built once, the first file has no numbered suffix
+    filenames = [os.path.join(path_A, file_stem_A if i == 0 else f"{file_stem_A}_{i + 1:02d}") for i in range(number_of_files)]
+    chunks = []  # Where channel A data will be stored, one array per file
+
+    for filename in filenames:
+        chunks.append(read_channel_A(filename))  # Parsed in C rather than row by row
+        print(f"Loaded {filename}, which contains {len(chunks[-1])} rows.")
+
+    channelA_arr_A = np.concatenate(chunks)  # Joins the files into one array for vector calculations.
     return channelA_arr_A
 
 # Load data for Channel A
 channelA_arr_A = load_files_A(number_of_files)
 
-# Generate time values for the x-axis (divide indices by 10,000)
-time_values = np.arange(len(channelA_arr_A)) / 10000
+# Generate time values for the x-axis (divide indices by 10,000), float32 to match the data and halve the memory
+time_values = np.arange(len(channelA_arr_A), dtype=np.float32) * np.float32(1 / 10000)
 
 # Manual Y-axis limits (set to None for automatic limits)
 manual_y_limits = (0, 400)  # Set Y-axis range to 0-400
 
+# Figure size and line downsampling (set downsample to False to plot every point)
+figure_size = (8, 4)
+downsample = True  # Keeps the min and max of each pixel column, the trace looks the same but the SVG is far smaller
+rasterize_trace = not downsample  # Embeds the full trace as an image in the SVG (axes and text stay vector), a downsampled trace is smaller as vector
+raster_dpi = 300  # Resolution of the embedded trace image
+
+def minmax_downsample(x, y, target_points):
+    """
+    Reduce a signal to at most target_points by keeping the minimum and maximum of each bucket of samples.
+    """
+    n_buckets = target_points // 2
+    if n_buckets < 1 or len(y) <= target_points:
+        return x, y
+    bucket = -(-len(y) // n_buckets)  # Samples per bucket, rounded up
+    starts = np.arange(0, len(y), bucket)
+    y_min = np.minimum.reduceat(y, starts)
+    y_max = np.maximum.reduceat(y, starts)
+    return np.repeat(x[starts], 2), np.column_stack((y_min, y_max)).ravel()  # Min and max interleaved per bucket
+
+if downsample:
+    target_points = int(figure_size[0] * plt.rcParams['figure.dpi'] * 2)  # Two points per pixel column
+    plot_time, plot_values = minmax_downsample(time_values, channelA_arr_A, target_points)
+else:
+    plot_time, plot_values = time_values, channelA_arr_A
+
 # Plotting Channel A data
-plt.figure(figsize=(8, 4))  # Make the figure larger
-plt.plot(time_values, channelA_arr_A, marker='none', linestyle='-', color='black', label='Channel A Data')  # Line plot with markers
+plt.figure(figsize=figure_size)  # Make the figure larger
+line, = plt.plot(plot_time, plot_values, marker='none', linestyle='-', color='black', label='Channel A Data')  # Line plot with markers
+line.set_rasterized(rasterize_trace)
 plt.xlabel('Time / s', fontsize=40)  # Increased font size for x-axis label
 plt.ylabel('Intensity / photons s$^{-1}$', fontsize=40)  # Increased font size for y-axis label
 plt.xticks(fontsize=40)  # Increase font size for x-axis ticks
@@ -96,7 +174,8 @@ base_filename = os.path.join(path_A, file_stem_A)
 filename = get_next_filename(base_filename)
 
 # Save the plot as SVG with the versioned filename
-plt.savefig(f"{filename}.svg", format="svg", bbox_inches='tight')
+plt.savefig(f"{filename}.svg", format="svg", bbox_inches='tight', dpi=raster_dpi)
 
 # Show the plot
-plt.show()
+if show_plot:
+    plt.show()
@@ -4,14 +4,24 @@
 # Input the correctly formatted csv/xlsx and a plot is exported with a Hill line fit.
 # The purpose of this code is to plot the processed data from the confocal measurements formatted in three columns.
 # The csv or xlsx file should be formatted with columns X-axis, Y-axis, SD.
-# Check if the x-axis is required to be on a logarithmic scale (line 92).
-# To adjust the Hill line fit the Vmax, Kd, and n values can be adjuste (line 50).
+# Check if the x-axis is required to be on a logarithmic scale (line 119).
+# To adjust the Hill line fit the Vmax, Kd, and n values can be adjuste (line 79).
 # The plot with the Hill line fit is exported as an SVG file.
 
+import os
 import pandas as pd
+import matplotlib
+
+show_plot = True  # Set to False for batch/headless runs, the plot is then only saved using the non-interactive Agg backend
+if not show_plot:
+    matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 from scipy.optimize import curve_fit
+try:
+    import numexpr as ne  # Optional, evaluates the Hill equation in a single fused pass
+except ImportError:
+    ne = None
 
 # Set all fonts to Arial, including for LaTeX
 plt.rcParams['font.family'] = 'Arial'  # Set all fonts to Arial
@@ -19,33 +29,52 @@ plt.rcParams['mathtext.fontset'] = 'custom'  # Use custom math font settings
 plt.rcParams['mathtext.rm'] = 'Arial'  # Regular (rm) font to Arial
 plt.rcParams['mathtext.it'] = 'Arial:italic'  # Italic font to Arial (if needed)
 plt.rcParams['mathtext.bf'] = 'Arial:bold'  # Bold font to Arial
-
-# Step 1: Read the Excel file
-df = pd.read_excel(r"FILEDIRECTORY\FILENAME.xlsx")
-
-# Step 2: Extract the relevant columns (ensure your Excel file has these columns)
-x = df['Conc']  # corresponding csv column title for x-axis
-y = df['Mean']  # corresponding csv column title for y-axis
-y_sd = df['SD']  # Standard deviation (SD) for error bars
+plt.rcParams['svg.fonttype'] = 'none'  # Keep text as text in the SVG instead of a path for every glyph
+
+# Step 1: Read the csv or Excel file (a .csv loads fastest, so convert large .xlsx files first)
+def read_table(path):
+    """
+    Read the Conc, Mean and SD columns from a .csv or .xlsx file.
+    csv files use the pyarrow engine and xlsx files the calamine engine, falling back to the pandas defaults if they are not installed.
+    """
+    dtypes = {'Conc': 'float64', 'Mean': 'float64', 'SD': 'float64'}
+    if os.path.splitext(path)[1].lower() == '.csv':
+        try:
+            return pd.read_csv(path, engine='pyarrow', dtype=dtypes)
+        except (ImportError, ValueError):  # pyarrow not installed, or a pandas older than 1.4 without the engine
+            return pd.read_csv(path, dtype=dtypes)
+    try:
+        return pd.read_excel(path, engine='calamine', dtype=dtypes)
+    except (ImportError, ValueError):  # python-calamine not installed, or a pandas older than 2.2 without the engine
+        return pd.read_excel(path, dtype=dtypes)
+
+df = read_table(r"FILEDIRECTORY\FILENAME.xlsx")
+
+# Step 2: Extract the relevant columns as numpy arrays (ensure your Excel file has these columns)
+x = df['Conc'].to_numpy()  # corresponding csv column title for x-axis
+y = df['Mean'].to_numpy()  # corresponding csv column title for y-axis
+y_sd = df['SD'].to_numpy()  # Standard deviation (SD) for error bars
 
 # Debugging: Check x values before filtering
 print(f"Original x values: {x}")
 
-# Ensure x contains only positive values and filter y and y_sd accordingly
+# Ensure x contains only positive values and filter y and y_sd accordingly (one mask, no index alignment)
 valid_indices = x > 0
-x = x[valid_indices]
-y = y[valid_indices]
-y_sd = y_sd[valid_indices]
+x, y, y_sd = x[valid_indices], y[valid_indices], y_sd[valid_indices]
 
 # Debugging: Check filtered data
 print(f"Filtered x values: {x}")
 print(f"Filtered y values: {y}")
 print(f"Filtered y_sd values: {y_sd}")
-print(f"Min x: {min(x)}, Max x: {max(x)}")
+print(f"Min x: {x.min()}, Max x: {x.max()}")
 
 # Define the Hill equation
 def hill_equation(x, Vmax, Kd, n):
-    return (Vmax * x**n) / (Kd**n + x**n)
+    kn = Kd**n
+    if ne is not None:
+        return ne.evaluate("(Vmax * x**n) / (kn + x**n)")
+    xn = np.power(x, n)  # Computed once and reused in the numerator and denominator
+    return (Vmax * xn) / (kn + xn)
 
 # Manually input the Hill equation parameters
 Vmax = 0.90052  # Example maximum response
@@ -53,7 +82,7 @@ Kd = 0.0101    # Example dissociation constant
 n = 1.67481     # Example Hill coefficient (slope)
 
 # Generate smooth x values for the fitted curve
-x_smooth = np.logspace(np.log10(min(x)), np.log10(max(x)), 500)
+x_smooth = np.logspace(np.log10(x.min()), np.log10(x.max()), 500)
 y_fitted = hill_equation(x_smooth, Vmax, Kd, n)
 
 # Debugging: Check ranges of x_smooth and y_fitted
@@ -63,11 +92,9 @@ print(f"Hill curve y_fitted range: {min(y_fitted)} to {max(y_fitted)}")
 # Step 4: Plot the scatter plot with error bars
 plt.figure(figsize=(14, 12))
 
-# Error bars with custom thickness and color
-plt.errorbar(x, y, yerr=y_sd, fmt='o', capsize=5, ecolor='black', elinewidth=2)
-
-# Make dots larger and black
-plt.scatter(x, y, s=150, c='black', zorder=5)  # s=100 makes dots larger, c='black' makes them black
+# Error bars with custom thickness and color, drawn with large black dots in the same call
+plt.errorbar(x, y, yerr=y_sd, fmt='o', markersize=12.25, markerfacecolor='black', markeredgecolor='black',
+             capsize=5, ecolor='black', elinewidth=2, zorder=5)  # markersize 12.25 gives the same dot area as scatter s=150
 
 # Plot the fitted Hill curve
 plt.plot(x_smooth, y_fitted, color='red', linewidth=2)
@@ -100,4 +127,5 @@ plt.tight_layout()  # Ensures the plot is fully contained within the figure
 plt.savefig(r"FILEDIRECTORY/SAVENAME.svg", format='svg')
 
 # Show the plot
-plt.show()
+if show_plot:
+    plt.show()